@@ -1,27 +1,164 @@
 import streamlit as st
-import subprocess
 import os
-import pandas as pd
-from io import StringIO
+import pyarrow.csv as pa_csv
+from io import BytesIO, StringIO
 import base64
-import uuid
-import hashlib
-from datetime import datetime
+import secrets
+import threading
+import traceback
+import zipfile
+from collections import deque
+from functools import partial
+
+import zone
 
 st.set_page_config(page_title="Anytone Zone Generator", page_icon="📻", layout="wide")
 
 # Function to generate a unique session ID for each user
 def get_session_id():
-    # Check if session_id exists in session state
-    if 'session_id' not in st.session_state:
-        # Generate a unique session ID based on timestamp and random UUID
-        unique_id = f"{datetime.now().timestamp()}_{uuid.uuid4()}"
-        # Hash the ID to make it shorter but still unique
-        hashed_id = hashlib.md5(unique_id.encode()).hexdigest()
-        # Store in session state
-        st.session_state.session_id = hashed_id
+    # Fast path: session_id already exists in session state
+    session_id = st.session_state.get('session_id')
+    if session_id:
+        return session_id
+    
+    # Generate a unique session ID from 128 random bits (32 hex characters)
+    session_id = secrets.token_hex(16)
+    st.session_state.session_id = session_id
+    
+    return session_id
+
+# Text stream that mirrors the most recent output lines into a placeholder while zone.py runs
+class LiveOutput(StringIO):
+    def __init__(self, placeholder, max_lines=50):
+        super().__init__()
+        self.placeholder = placeholder
+        self.recent_lines = deque(maxlen=max_lines)
+        self.partial_line = ''
+        self.owner = threading.current_thread()
+        # zone.py logs from its worker threads too, keep their writes from interleaving
+        self.write_lock = threading.Lock()
+    
+    def write(self, text):
+        with self.write_lock:
+            *lines, self.partial_line = (self.partial_line + text).split('\n')
+            self.recent_lines.extend(lines)
+            # Only the script thread may update the page, other threads just buffer
+            if lines and threading.current_thread() is self.owner:
+                self.placeholder.code('\n'.join(self.recent_lines))
+            return super().write(text)
+
+# Function to filter the downloaded repeater list, cached per search and BM.json version so repeated clicks skip the work
+# Cached functions must not update page elements, so console output is captured and returned with the result
+@st.cache_data(ttl=3600, show_spinner=False)
+def filter_repeaters(search_args, bm_version):
+    output = StringIO()
+    repeaters = zone.fetch_repeaters(zone.parse_args(list(search_args)), download=False,
+                                     log=partial(print, file=output))
+    return repeaters, output.getvalue()
+
+# Function to run zone.py in-process, streaming its console output into a placeholder
+# Output goes through a per-run log function, so generations of different users run concurrently
+# Returns the generated files as bytes keyed by file name, nothing is written to disk
+def run_zone(argv, search_args, placeholder):
+    output, error = LiveOutput(placeholder), StringIO()
+    log = partial(print, file=output)
+    contents = {}
+    try:
+        args = zone.parse_args(argv)
+        # Download outside the cache, a fresh BM.json gets a new modification time and so new cache entries
+        zone.download_file(args.force, log)
+        repeaters, filter_output = filter_repeaters(tuple(search_args), os.stat(zone.bm_file).st_mtime_ns)
+        log(filter_output, end='')
+        contents = zone.build_zone(args, repeaters, log=log)
+        returncode = 0
+    except SystemExit as e:
+        # argparse reports invalid arguments through sys.exit(), its usage message goes to the server log
+        print(f"Invalid zone.py arguments: {' '.join(argv)}", file=error)
+        returncode = e.code if isinstance(e.code, int) else 1
+    except Exception:
+        traceback.print_exc(file=error)
+        returncode = 1
+    
+    return returncode, output.getvalue(), error.getvalue(), contents
+
+# Miles/km conversion factors for the radius inputs
+MILES_PER_KM = 0.621371
+KM_PER_MILE = 1 / MILES_PER_KM
+
+# Function to render a radius input with a km/miles toggle, always returns the radius in km
+def radius_input(key, center):
+    distance_unit = st.radio("Distance Unit", ["km", "miles"], horizontal=True, key=f"{key}_distance_unit")
+    
+    if distance_unit == "km":
+        radius = st.number_input("Radius (km)", min_value=1, value=100, 
+                                help=f"Area radius in kilometers around {center}",
+                                key=f"{key}_radius_km")
+        st.text(f"Equivalent: {radius:.1f} km = {radius * MILES_PER_KM:.1f} miles")
+    else:  # miles
+        radius_miles = st.number_input("Radius (miles)", min_value=1, value=60, 
+                                     help=f"Area radius in miles around {center}",
+                                     key=f"{key}_radius_miles")
+        radius = radius_miles * KM_PER_MILE  # Convert miles to km for backend
+        st.text(f"Equivalent: {radius_miles:.1f} miles = {radius:.1f} km")
+    
+    return radius
+
+# Function to pack generated files into an in-memory ZIP archive
+def build_zip(contents):
+    # Generated CSVs are small and few, so a single deflate pass at level 1 is faster than
+    # fanning compression out to threads and reassembling the archive by hand
+    zip_buffer = BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zip_file:
+        for name, data in contents.items():
+            zip_file.writestr(name, data)
+    
+    return zip_buffer.getvalue()
+
+# Function to bundle generated files for session state, the ZIP is built once here rather than on every rerun
+def make_bundle(contents):
+    # A single file is offered directly, only bundle several files into a ZIP
+    return {"files": contents, "zip": build_zip(contents) if len(contents) > 1 else None}
+
+# Function to render download buttons (and optional table previews) for a bundle of generated files
+def show_downloads(bundle, key, zip_filename, preview=False):
+    contents = bundle["files"]
+    if not contents:
+        return
+    
+    st.subheader("Download Generated Files")
+    
+    if bundle["zip"]:
+        # Create download button for the zip file
+        st.download_button(
+            label="📦 Download All Files as ZIP",
+            data=bundle["zip"],
+            file_name=zip_filename,
+            mime="application/zip",
+            key=f"download_{key}_zip"
+        )
+        
+        # Horizontal line to separate individual file downloads
+        st.markdown("---")
+        st.markdown("Or download individual files:")
     
-    return st.session_state.session_id
+    # CSV file downloads
+    for csv_file in contents:
+        if preview:
+            # Display the first rows of the CSV as a table, collapsed until requested
+            with st.expander(f"Preview {csv_file}"):
+                try:
+                    table = pa_csv.read_csv(BytesIO(contents[csv_file]))
+                    st.dataframe(table.slice(0, 500), height=300)
+                except:
+                    st.warning(f"Could not display {csv_file} as a table")
+        
+        st.download_button(
+            label=f"Download {csv_file}",
+            data=contents[csv_file],
+            file_name=csv_file,
+            mime="text/csv",
+            key=f"download_{key}_{csv_file}"
+        )
 
 # Get or create a unique session ID for the current user
 session_id = get_session_id()
@@ -32,7 +169,9 @@ st.markdown("Generate Anytone zone files from BrandMeister repeater list")
 # Create tabs for different modes
 tab1, tab2 = st.tabs(["Standard Mode", "Talkgroup Mode"])
 
-with tab1:
+# Standard mode tab, a fragment so interacting with its widgets only reruns this tab
+@st.fragment
+def standard_tab():
     st.header("Standard Mode")
     st.markdown("Create a single zone file with channels for each repeater timeslot")
     col1, col2 = st.columns(2)
@@ -50,19 +189,7 @@ with tab1:
         
         elif search_type == "qth":
             qth = st.text_input("QTH Locator", help="QTH locator index like KO26BX")
-            
-            # Add distance unit toggle
-            distance_unit = st.radio("Distance Unit", ["km", "miles"], horizontal=True)
-            
-            if distance_unit == "km":
-                radius = st.number_input("Radius (km)", min_value=1, value=100, 
-                                        help="Area radius in kilometers around the center of the chosen QTH locator")
-                st.text(f"Equivalent: {radius:.1f} km = {radius * 0.621371:.1f} miles")
-            else:  # miles
-                radius_miles = st.number_input("Radius (miles)", min_value=1, value=60, 
-                                             help="Area radius in miles around the center of the chosen QTH locator")
-                radius = radius_miles / 0.621371  # Convert miles to km for backend
-                st.text(f"Equivalent: {radius_miles:.1f} miles = {radius:.1f} km")
+            radius = radius_input("qth", "the center of the chosen QTH locator")
         
         elif search_type == "gps":
             col_lat, col_lon = st.columns(2)
@@ -70,19 +197,7 @@ with tab1:
                 latitude = st.number_input("Latitude", format="%.6f")
             with col_lon:
                 longitude = st.number_input("Longitude", format="%.6f")
-                
-            # Add distance unit toggle
-            distance_unit = st.radio("Distance Unit", ["km", "miles"], horizontal=True, key="gps_distance_unit")
-            
-            if distance_unit == "km":
-                radius = st.number_input("Radius (km)", min_value=1, value=100, 
-                                        help="Area radius in kilometers around the GPS coordinates")
-                st.text(f"Equivalent: {radius:.1f} km = {radius * 0.621371:.1f} miles")
-            else:  # miles
-                radius_miles = st.number_input("Radius (miles)", min_value=1, value=60, 
-                                             help="Area radius in miles around the GPS coordinates")
-                radius = radius_miles / 0.621371  # Convert miles to km for backend
-                st.text(f"Equivalent: {radius_miles:.1f} miles = {radius:.1f} km")
+            radius = radius_input("gps", "the GPS coordinates")
     
     with col2:
         force_download = st.checkbox("Force Download", 
@@ -116,131 +231,72 @@ with tab1:
         elif not zone_name:
             st.error("Please enter a zone name")
         else:
-            # Build command with user-specific output directory
-            user_output_dir = f"output_{session_id}"
-            cmd = ["python", "zone.py", "-n", zone_name, "-b", band, "-t", search_type, "-o", user_output_dir]
-            
-            if force_download:
-                cmd.extend(["-f"])
+            # Build search options, these select the repeaters and key the repeater list cache
+            search_args = ["-b", band, "-t", search_type]
             
             if search_type == "mcc":
-                cmd.extend(["-m", mcc])
+                search_args.extend(["-m", mcc])
             elif search_type == "qth":
                 # Always pass radius in km to the backend as an integer
-                cmd.extend(["-q", qth, "-r", str(int(radius))])
+                search_args.extend(["-q", qth, "-r", str(int(radius))])
             elif search_type == "gps":
-                # Handle negative coordinates using the format from README example
-                if latitude < 0:
-                    cmd.extend([f"-lat=-{abs(latitude)}"])
-                else:
-                    cmd.extend(["-lat", str(latitude)])
-                
-                # Use the -lon=VALUE format for negative longitude values
-                if longitude < 0:
-                    cmd.extend([f"-lon=-{abs(longitude)}"])
-                else:
-                    cmd.extend(["-lon", str(longitude)])
+                # The -lat=VALUE form keeps argparse from reading negative coordinates as flags
+                search_args.extend([f"-lat={latitude:.6f}", f"-lon={longitude:.6f}"])
                 
                 # Always pass radius in km to the backend as an integer
-                cmd.extend(["-r", str(int(radius))])
+                search_args.extend(["-r", str(int(radius))])
             
             if only_with_power:
-                cmd.extend(["-p", str(min_power)])
+                search_args.extend(["-p", str(min_power)])
             
             if six_digit:
-                cmd.extend(["-6"])
+                search_args.extend(["-6"])
             
-            cmd.extend(["-zc", str(zone_capacity)])
+            if callsign_filter:
+                search_args.extend(["-cs", callsign_filter])
             
-
+            # Build the equivalent zone.py command
+            cmd = ["python", "zone.py", "-n", zone_name] + search_args + ["-zc", str(zone_capacity)]
             
-            if callsign_filter:
-                cmd.extend(["-cs", callsign_filter])
+            if force_download:
+                cmd.extend(["-f"])
             
             # Show command
             cmd_str = " ".join(cmd)
             st.code(cmd_str, language="bash")
             
-            # Run command
+            # Run zone.py in-process
             with st.spinner("Generating zone files..."):
-                process = subprocess.Popen(
-                    cmd, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                output, error = process.communicate()
+                output_placeholder = st.empty()
+                returncode, output, error, contents = run_zone(cmd[2:], search_args, output_placeholder)
                 
-                if process.returncode == 0:
+                if returncode == 0:
                     st.success("Zone files generated successfully!")
-                    st.code(output)
+                    output_placeholder.code(output)
                     
-                    # Find generated CSV files in user-specific output directory
-                    output_dir = f"output_{session_id}"
-                    if not os.path.exists(output_dir):
-                        os.makedirs(output_dir)
-                    csv_files = [f for f in os.listdir(output_dir) if f.endswith('.csv')]
-                    
-                    if csv_files:
-                        st.subheader("Download Generated Files")
-                        
-                        # Create a zip file with all CSV files
-                        import io
-                        import zipfile
-                        
-                        zip_buffer = io.BytesIO()
-                        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                            for csv_file in csv_files:
-                                file_path = os.path.join(output_dir, csv_file)
-                                with open(file_path, "r", newline='') as file:
-                                    zip_file.writestr(csv_file, file.read())
-                        
-                        # Create download button for the zip file
-                        zip_buffer.seek(0)
-                        zip_bytes = zip_buffer.getvalue()
-                        zip_filename = f"Anytone_files_{session_id[:8]}.zip"
-                        st.download_button(
-                            label="📦 Download All Files as ZIP",
-                            data=zip_bytes,
-                            file_name=zip_filename,
-                            mime="application/zip",
-                            key="download_standard_zip"
-                        )
-                        
-                        # Horizontal line to separate individual file downloads
-                        st.markdown("---")
-                        st.markdown("Or download individual files:")
-                        
-                        # CSV file downloads
-                        for csv_file in csv_files:
-                            file_path = os.path.join(output_dir, csv_file)
-                            with open(file_path, "r", newline='') as file:
-                                file_content = file.read()
-                                
-                            b64 = base64.b64encode(file_content.encode()).decode()
-                            href = f'<a href="data:text/csv;base64,{b64}" download="{csv_file}">Download {csv_file}</a>'
-                            st.markdown(href, unsafe_allow_html=True)
-                    
-
+                    # Keep the files in session state so the downloads survive reruns
+                    st.session_state.standard_bundle = make_bundle(contents)
                 else:
+                    st.session_state.pop("standard_bundle", None)
                     st.error("Error generating zone files")
                     st.code(error)
+    
+    # Downloads for the last generated files
+    if st.session_state.get("standard_bundle"):
+        show_downloads(st.session_state.standard_bundle, "standard", f"Anytone_files_{session_id[:8]}.zip")
 
-with tab2:
+# Talkgroup mode tab, a fragment so interacting with its widgets only reruns this tab
+@st.fragment
+def talkgroup_tab():
     st.header("Talkgroup Mode")
     st.markdown("Create a zone file for each repeater with channels for talkgroups on the timeslots")
     
-    # Create user-specific output directory using session ID
-    user_output_dir = f"output_{session_id}"
-    if not os.path.exists(user_output_dir):
-        os.makedirs(user_output_dir)
-    
     # Create download link for talkgroups_template.csv
     template_href = ""
     if os.path.exists("talkgroups_template.csv"):
-        with open("talkgroups_template.csv", "r", newline='') as file:
+        with open("talkgroups_template.csv", "rb") as file:
             template_content = file.read()
-        template_b64 = base64.b64encode(template_content.encode()).decode()
+        template_b64 = base64.b64encode(template_content).decode()
         template_href = f'<a href="data:text/csv;base64,{template_b64}" download="talkgroups_template.csv">talkgroups_template.csv</a>'
     
     # Add file uploader for custom talkgroups template
@@ -261,8 +317,8 @@ with tab2:
         
         # Display the uploaded file as a dataframe
         try:
-            df = pd.read_csv(uploaded_file)
-            st.dataframe(df, height=200)
+            table = pa_csv.read_csv(BytesIO(uploaded_file.getvalue()))
+            st.dataframe(table, height=200)
         except:
             st.warning("Could not display the uploaded file as a table")
     
@@ -287,21 +343,7 @@ with tab2:
         
         elif search_type_tg == "qth":
             qth_tg = st.text_input("QTH Locator", help="QTH locator index like KO26BX", key="qth_tg")
-            
-            # Add distance unit toggle
-            distance_unit_tg = st.radio("Distance Unit", ["km", "miles"], horizontal=True, key="qth_tg_distance_unit")
-            
-            if distance_unit_tg == "km":
-                radius_tg = st.number_input("Radius (km)", min_value=1, value=100, 
-                                           help="Area radius in kilometers around the center of the chosen QTH locator",
-                                           key="radius_tg")
-                st.text(f"Equivalent: {radius_tg:.1f} km = {radius_tg * 0.621371:.1f} miles")
-            else:  # miles
-                radius_miles_tg = st.number_input("Radius (miles)", min_value=1, value=60, 
-                                                help="Area radius in miles around the center of the chosen QTH locator",
-                                                key="radius_miles_tg")
-                radius_tg = radius_miles_tg / 0.621371  # Convert miles to km for backend
-                st.text(f"Equivalent: {radius_miles_tg:.1f} miles = {radius_tg:.1f} km")
+            radius_tg = radius_input("qth_tg", "the center of the chosen QTH locator")
         
         elif search_type_tg == "gps":
             col_lat_tg, col_lon_tg = st.columns(2)
@@ -309,21 +351,7 @@ with tab2:
                 latitude_tg = st.number_input("Latitude", format="%.6f", key="latitude_tg")
             with col_lon_tg:
                 longitude_tg = st.number_input("Longitude", format="%.6f", key="longitude_tg")
-                
-            # Add distance unit toggle
-            distance_unit_tg = st.radio("Distance Unit", ["km", "miles"], horizontal=True, key="gps_tg_distance_unit")
-            
-            if distance_unit_tg == "km":
-                radius_tg = st.number_input("Radius (km)", min_value=1, value=100, 
-                                           help="Area radius in kilometers around the GPS coordinates",
-                                           key="radius_tg")
-                st.text(f"Equivalent: {radius_tg:.1f} km = {radius_tg * 0.621371:.1f} miles")
-            else:  # miles
-                radius_miles_tg = st.number_input("Radius (miles)", min_value=1, value=60, 
-                                                help="Area radius in miles around the GPS coordinates",
-                                                key="radius_miles_tg")
-                radius_tg = radius_miles_tg / 0.621371  # Convert miles to km for backend
-                st.text(f"Equivalent: {radius_miles_tg:.1f} miles = {radius_tg:.1f} km")
+            radius_tg = radius_input("gps_tg", "the GPS coordinates")
     
     with col2:
         force_download_tg = st.checkbox("Force Download", 
@@ -354,120 +382,55 @@ with tab2:
         elif search_type_tg == "gps" and (latitude_tg == 0 and longitude_tg == 0):
             st.error("Please enter valid GPS coordinates")
         else:
-            # Build command with user-specific output directory
-            user_output_dir = f"output_{session_id}"
-            cmd = ["python", "zone.py", "-b", band_tg, "-t", search_type_tg, "-tg", "-o", user_output_dir]
-            
-            # Add city prefix option if selected
-            if use_city_prefix:
-                cmd.extend(["--city-prefix"])
-            
-            if force_download_tg:
-                cmd.extend(["-f"])
+            # Build search options, these select the repeaters and key the repeater list cache
+            search_args = ["-b", band_tg, "-t", search_type_tg]
             
             if search_type_tg == "mcc":
-                cmd.extend(["-m", mcc_tg])
+                search_args.extend(["-m", mcc_tg])
             elif search_type_tg == "qth":
                 # Always pass radius in km to the backend as an integer
-                cmd.extend(["-q", qth_tg, "-r", str(int(radius_tg))])
+                search_args.extend(["-q", qth_tg, "-r", str(int(radius_tg))])
             elif search_type_tg == "gps":
-                # Handle negative coordinates using the format from README example
-                if latitude_tg < 0:
-                    cmd.extend([f"-lat=-{abs(latitude_tg)}"])
-                else:
-                    cmd.extend(["-lat", str(latitude_tg)])
-                
-                # Use the -lon=VALUE format for negative longitude values
-                if longitude_tg < 0:
-                    cmd.extend([f"-lon=-{abs(longitude_tg)}"])
-                else:
-                    cmd.extend(["-lon", str(longitude_tg)])
+                # The -lat=VALUE form keeps argparse from reading negative coordinates as flags
+                search_args.extend([f"-lat={latitude_tg:.6f}", f"-lon={longitude_tg:.6f}"])
                 
                 # Always pass radius in km to the backend as an integer
-                cmd.extend(["-r", str(int(radius_tg))])
+                search_args.extend(["-r", str(int(radius_tg))])
             
             if only_with_power_tg:
-                cmd.extend(["-p", str(min_power_tg)])
+                search_args.extend(["-p", str(min_power_tg)])
             
             if six_digit_tg:
-                cmd.extend(["-6"])
+                search_args.extend(["-6"])
             
             if callsign_filter_tg:
-                cmd.extend(["-cs", callsign_filter_tg])
+                search_args.extend(["-cs", callsign_filter_tg])
+            
+            # Build the equivalent zone.py command
+            cmd = ["python", "zone.py", "-tg"] + search_args
+            
+            # Add city prefix option if selected
+            if use_city_prefix:
+                cmd.extend(["--city-prefix"])
+            
+            if force_download_tg:
+                cmd.extend(["-f"])
             
             # Show command
             cmd_str = " ".join(cmd)
             st.code(cmd_str, language="bash")
             
-            # Run command
+            # Run zone.py in-process
             with st.spinner("Generating talkgroup files..."):
-                process = subprocess.Popen(
-                    cmd, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                output, error = process.communicate()
+                output_placeholder = st.empty()
+                returncode, output, error, contents = run_zone(cmd[2:], search_args, output_placeholder)
                 
-                if process.returncode == 0:
+                if returncode == 0:
                     st.success("Talkgroup files generated successfully!")
-                    st.code(output)
-                    
-                    # Find generated CSV files in user-specific output directory
-                    output_dir = f"output_{session_id}"
-                    if not os.path.exists(output_dir):
-                        os.makedirs(output_dir)
-                    csv_files = [f for f in os.listdir(output_dir) if f.endswith('.csv')]
+                    output_placeholder.code(output)
                     
-                    if csv_files:
-                        st.subheader("Download Generated Files")
-                        
-                        # Create a zip file with all CSV files
-                        import io
-                        import zipfile
-                        
-                        zip_buffer = io.BytesIO()
-                        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                            for csv_file in csv_files:
-                                file_path = os.path.join(output_dir, csv_file)
-                                with open(file_path, "r", newline='') as file:
-                                    zip_file.writestr(csv_file, file.read())
-                        
-                        # Create download button for the zip file
-                        zip_buffer.seek(0)
-                        zip_bytes = zip_buffer.getvalue()
-                        zip_filename = f"anybmfiles_{session_id[:8]}.zip"
-                        st.download_button(
-                            label="📦 Download All Files as ZIP",
-                            data=zip_bytes,
-                            file_name=zip_filename,
-                            mime="application/zip",
-                            key="download_all_zip"
-                        )
-                        
-                        # Horizontal line to separate individual file downloads
-                        st.markdown("---")
-                        st.markdown("Or download individual files:")
-                        
-                        # CSV file downloads with preview
-                        for csv_file in csv_files:
-                            file_path = os.path.join(output_dir, csv_file)
-                            
-                            # Display CSV as a table
-                            st.subheader(f"{csv_file}")
-                            try:
-                                df = pd.read_csv(file_path)
-                                st.dataframe(df)
-                            except:
-                                st.warning(f"Could not display {csv_file} as a table")
-                            
-                            # Provide download link
-                            with open(file_path, "r", newline='') as file:
-                                file_content = file.read()
-                                
-                            b64 = base64.b64encode(file_content.encode()).decode()
-                            href = f'<a href="data:text/csv;base64,{b64}" download="{csv_file}">Download {csv_file}</a>'
-                            st.markdown(href, unsafe_allow_html=True)
+                    # Keep the files in session state so the downloads survive reruns
+                    st.session_state.talkgroup_bundle = make_bundle(contents)
                     
                     # Clean up user-specific talkgroups_uploads directory
                     talkgroups_uploads_dir = f"talkgroups_uploads_{session_id}"
@@ -480,8 +443,19 @@ with tab2:
                             except Exception as e:
                                 st.warning(f"Error deleting {file_path}: {e}")
                 else:
+                    st.session_state.pop("talkgroup_bundle", None)
                     st.error("Error generating talkgroup files")
                     st.code(error)
+    
+    # Downloads and previews for the last generated files
+    if st.session_state.get("talkgroup_bundle"):
+        show_downloads(st.session_state.talkgroup_bundle, "talkgroup", f"anybmfiles_{session_id[:8]}.zip", preview=True)
+
+with tab1:
+    standard_tab()
+
+with tab2:
+    talkgroup_tab()
 
 # Help section
 st.sidebar.header("Help")
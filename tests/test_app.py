@@ -0,0 +1,64 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+from streamlit.testing.v1 import AppTest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# Two repeaters in MCC 310, enough for a standard mode zone
+REPEATERS = [
+    {'id': 310001, 'callsign': 'W1AAA', 'rx': '444.1000', 'tx': '449.1000', 'colorcode': 1,
+     'city': 'Boston, MA', 'last_seen': '2025-01-01 00:00:00', 'lat': 42.36, 'lng': -71.06, 'pep': 50},
+    {'id': 310002, 'callsign': 'W2BBB', 'rx': '145.2000', 'tx': '144.6000', 'colorcode': 2,
+     'city': 'Albany, NY', 'last_seen': '2025-01-01 00:00:00', 'lat': 42.65, 'lng': -73.75, 'pep': 25},
+]
+
+
+class FakeResponse:
+    status_code = 200
+    content = json.dumps(REPEATERS).encode()
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return REPEATERS
+
+
+class StandardModeTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.work_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.work_dir.name)
+        patcher = mock.patch.object(requests.Session, 'request', return_value=FakeResponse())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.work_dir.cleanup()
+
+    def generate(self, at, force_download):
+        at.text_input[0].set_value('Test')
+        at.text_input[1].set_value('310')
+        at.checkbox[0].set_value(force_download)
+        at.button(key='generate_standard').click().run()
+        self.assertFalse(at.exception)
+        self.assertEqual([error.value for error in at.error], [])
+        self.assertEqual([success.value for success in at.success], ['Zone files generated successfully!'])
+
+    def test_repeated_search_after_force_download(self):
+        at = AppTest.from_file(os.path.join(REPO_DIR, 'app.py'), default_timeout=60).run()
+        self.generate(at, force_download=True)
+        # The second search is served from the repeater cache
+        self.generate(at, force_download=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import zone
+
+
+class CsvFieldTest(unittest.TestCase):
+    def test_matches_csv_writer(self):
+        values = [None, 0, 7, 2.5, '', 'W1AAA', 'a,b', 'say "hi"', 'line\nbreak', 'cr\rlf', ' padded ']
+        for value in values:
+            with self.subTest(value=value):
+                expected = io.StringIO()
+                csv.writer(expected, lineterminator='\r\n').writerow(['x', value, 'y'])
+                self.assertEqual(expected.getvalue(), f'x,{zone.csv_field(value)},y\r\n')
+
+
+
+class LoadTalkgroupNamesTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.work_dir.cleanup)
+        cache_file = os.path.join(self.work_dir.name, 'tg_name_cache.json')
+        patcher = mock.patch.object(zone, 'tg_name_cache_file', cache_file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def load(self, cache):
+        with open(zone.tg_name_cache_file, 'w') as file:
+            json.dump(cache, file)
+        return zone.load_talkgroup_names()
+
+    def test_keeps_fresh_entries(self):
+        now = time.time()
+        self.assertEqual(self.load({'91': ['Worldwide', now]}), {'91': ['Worldwide', now]})
+
+    def test_drops_expired_and_malformed_entries(self):
+        cache = {'91': ['Old', time.time() - zone.tg_name_cache_max_age - 1], '92': ['Bad', 'yesterday'],
+                 '93': [None, time.time()], '94': 'Name only', '95': ['Short']}
+        self.assertEqual(self.load(cache), {})
+
+    def test_ignores_cache_that_is_not_a_dict(self):
+        self.assertEqual(self.load([]), {})
+        self.assertEqual(self.load('names'), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
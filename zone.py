@@ -1,15 +1,26 @@
 #!/usr/bin/env python3
 
 import argparse
+import csv
+import io
 import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from glob import glob
 from os.path import exists
 from tabulate import tabulate
 
-import geopy.distance
 import maidenhead
 import mobile_codes
+import numpy as np
+import orjson
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 parser = argparse.ArgumentParser(description='Generate MOTOTRBO zone files from BrandMeister.')
@@ -45,134 +56,202 @@ parser.add_argument('-o', '--output', default='output',
                     help='Output directory for generated files. Default is "output".')
 parser.add_argument('--city-prefix', action='store_true',
                     help='Prefix channel names with 3-character city abbreviation (e.g. "NYC.TG123")')
-
-
-args = parser.parse_args()
-
-# Validate that name is provided if not using talkgroups mode
-if not args.name and not args.talkgroups:
-    parser.error("the -n/--name argument is required when not using -tg/--talkgroups")
+parser.add_argument('--quiet', action='store_true',
+                    help='Do not print the table of generated channels, useful for headless runs.')
 
 
 bm_url = 'https://api.brandmeister.network/v2/device'
 bm_file = 'BM.json'
-filtered_list = []
-output_list = []
-existing = {}
-
-
-if args.type == 'qth':
-    qth_coords = maidenhead.to_location(args.qth, center=True)
-if args.type == 'gps':
-    qth_coords = (args.lat, args.lon)
+earth_radius_km = 6371.009
+tg_name_cache_file = 'tg_name_cache.json'
+tg_name_cache_max_age = 7 * 24 * 3600  # Seconds before a cached talkgroup name is fetched again
+talkgroup_workers = 24
+talkgroup_name_workers = 8
 
-if args.mcc and not str(args.mcc).isdigit():
-    args.mcc = mobile_codes.alpha2(args.mcc)[4]
+# Timeslot suffixes of the two channels created per repeater in standard mode
+ts_suffixes = (' TS1', ' TS2')
 
+# Shared HTTP session so all BrandMeister downloads and API calls reuse kept-alive connections,
+# retrying transient failures with a short backoff
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=32,
+                                      max_retries=Retry(total=3, backoff_factor=0.2,
+                                                        status_forcelist=[429, 500, 502, 503, 504])))
 
+# Requests are made with verify=False, silence the warning once instead of per call
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
+def download_file(force=False, log=print):
+    if not exists(bm_file) or force:
+        log(f'Downloading from {bm_url}')
 
-def download_file():
-    if not exists(bm_file) or args.force:
-        print(f'Downloading from {bm_url}')
-
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-        response = requests.get(bm_url, verify=False)
+        response = session.get(bm_url, verify=False)
         response.raise_for_status()
 
-        with open(bm_file, 'wb') as file:
+        # Replace the file atomically so a concurrent run never reads a partly written list
+        fd, temp_file = tempfile.mkstemp(prefix=f'{bm_file}.', suffix='.tmp', dir=os.path.dirname(bm_file) or '.')
+        with os.fdopen(fd, 'wb') as file:
             file.write(response.content)
+        os.replace(temp_file, bm_file)
 
-        print(f'Saved to {bm_file}')
+        log(f'Saved to {bm_file}')
 
 
-def check_distance(loc1, loc2):
-    return geopy.distance.great_circle(loc1, loc2).km
+def check_distances(center, repeaters):
+    """
+    Calculate great-circle distances from a center point to all repeaters at once
+    
+    Args:
+        center (tuple): Latitude and longitude of the center point
+        repeaters (list): Repeaters with 'lat' and 'lng' keys
+        
+    Returns:
+        numpy.ndarray: Distance in kilometers for each repeater
+    """
+    lat = np.radians(np.fromiter((item['lat'] for item in repeaters), dtype=np.float64, count=len(repeaters)))
+    lng = np.radians(np.fromiter((item['lng'] for item in repeaters), dtype=np.float64, count=len(repeaters)))
+    center_lat, center_lng = np.radians(center)
 
+    # Haversine formula
+    a = np.sin((lat - center_lat) / 2) ** 2 + np.cos(center_lat) * np.cos(lat) * np.sin((lng - center_lng) / 2) ** 2
+    return 2 * earth_radius_km * np.arcsin(np.sqrt(a))
 
-def filter_list():
-    global filtered_list
-    global existing
-    global qth_coords
 
-    f = open(bm_file, "r")
+def check_radius(center, repeaters, radius):
+    """
+    Find repeaters within a radius of a center point
+    
+    The latitude difference alone is a lower bound of the great-circle distance, so repeaters
+    outside the latitude band of the radius are dropped before any distance is calculated.
+    
+    Args:
+        center (tuple): Latitude and longitude of the center point
+        repeaters (list): Repeaters with 'lat' and 'lng' keys
+        radius (float): Radius in kilometers
+        
+    Returns:
+        numpy.ndarray: True for each repeater within the radius
+    """
+    lat = np.fromiter((item['lat'] for item in repeaters), dtype=np.float64, count=len(repeaters))
+    max_lat_delta = np.degrees(radius / earth_radius_km) + 1e-9  # Slack for rounding at the band edge
+    candidates = np.flatnonzero(np.abs(lat - center[0]) <= max_lat_delta)
 
-    json_list = json.loads(f.read())
-    sorted_list = sorted(json_list, key=lambda k: (k['callsign'], int(k["id"])))
+    in_radius = np.zeros(len(repeaters), dtype=bool)
+    in_radius[candidates] = check_distances(center, [repeaters[i] for i in candidates]) <= radius
+    return in_radius
 
-    for item in sorted_list:
-        if args.band != 'both':
-            if not ((args.band == 'vhf' and item['rx'].startswith('1')) or (
-                    args.band == 'uhf' and item['rx'].startswith('4'))):
-                continue
 
-        if args.type == 'mcc':
-            is_starts = False
+def filter_list(args, center=None):
+    """
+    Select repeaters from the downloaded BrandMeister list matching the search options
+    
+    Args:
+        args (argparse.Namespace): Parsed arguments with the band and search options
+        center (tuple): Latitude and longitude of the search center in qth and gps modes
+        
+    Returns:
+        list: Matching repeaters sorted by callsign and ID, without duplicates
+    """
+    filtered_list = []
+    callsign_counts = {}
+
+    # Filter options, looked up once instead of per repeater
+    callsign_filter = args.callsign
+    want_band = args.band
+    want_mcc = args.type == 'mcc'
+    mcc_prefixes = tuple(args.mcc) if type(args.mcc) is list else (args.mcc,)
+    want_six = args.six
+    want_pep = bool(args.pep)
+    min_pep = int(args.pep) if want_pep and args.pep != '0' else 0
+
+    with open(bm_file, "rb") as f:
+        json_list = orjson.loads(f.read())
+
+    # (rx, tx, callsign) of every accepted repeater, to skip duplicates
+    seen_channels = set()
+
+    # Drop repeaters outside the radius in one vectorized pass
+    if args.type == 'qth' or args.type == 'gps':
+        in_radius = check_radius(center, json_list, args.radius)
+        json_list = [json_list[i] for i in np.flatnonzero(in_radius).tolist()]
+
+    survivors = []
+
+    for item in json_list:
+        if want_band != 'both':
+            rx = item['rx']
+            if not ((want_band == 'vhf' and rx.startswith('1')) or (
+                    want_band == 'uhf' and rx.startswith('4'))):
+                continue
 
-            if type(args.mcc) is list:
-                for mcc in args.mcc:
-                    if str(item['id']).startswith(mcc):
-                        is_starts = True
-            else:
-                if str(item['id']).startswith(args.mcc):
-                    is_starts = True
+        id_str = str(item['id'])
 
-            if not is_starts:
-                continue
+        # Cheapest checks first so most repeaters are rejected early
+        if want_six and len(id_str) != 6:
+            continue
 
-        if (args.type == 'qth' or args.type == 'gps') and check_distance(qth_coords,
-                                                                         (item['lat'], item['lng'])) > args.radius:
+        if callsign_filter and callsign_filter not in item['callsign']:
             continue
 
-        if args.pep:
+        if want_pep:
+            pep_str = str(item['pep'])
             # Skip if power is not defined or is zero
-            if not str(item['pep']).isdigit() or str(item['pep']) == '0':
+            if not pep_str.isdigit() or pep_str == '0':
                 continue
             # Skip if power is less than specified minimum (if provided)
-            if args.pep != '0' and int(item['pep']) < int(args.pep):
+            if min_pep and int(pep_str) < min_pep:
                 continue
 
-        if args.six and not len(str(item['id'])) == 6:
+        if want_mcc and not id_str.startswith(mcc_prefixes):
             continue
 
-        if args.callsign and (not args.callsign in item['callsign']):
-            continue
+        survivors.append(item)
+
+    # Sort only the repeaters that passed the filters; duplicates and turns depend on this order
+    survivors.sort(key=lambda k: (k['callsign'], int(k["id"])))
 
+    for item in survivors:
         if item['callsign'] == '' or item['callsign'] is None:
             item['callsign'] = str(item['id'])
 
         if item['callsign'] is not None:
             item['callsign'] = item['callsign'].split()[0]
 
-        if any((existing['rx'] == item['rx'] and existing['tx'] == item['tx'] and existing['callsign'] == item[
-            'callsign']) for existing in filtered_list):
+        channel_key = (item['rx'], item['tx'], item['callsign'])
+        if channel_key in seen_channels:
             continue
+        seen_channels.add(channel_key)
 
-        if not item['callsign'] in existing: existing[item['callsign']] = 0
-        existing[item['callsign']] += 1
-        item['turn'] = existing[item['callsign']]
+        if not item['callsign'] in callsign_counts: callsign_counts[item['callsign']] = 0
+        callsign_counts[item['callsign']] += 1
+        item['turn'] = callsign_counts[item['callsign']]
+
+        # City name and its 3-character abbreviation, reused for channel and zone names
+        city = item['city'].split(',')[0].strip() if item['city'] else 'Unknown'
+        item['_city_base'] = city
+        item['_city_abbr'] = city[:3].upper() if len(city) >= 3 else (city + 'XXX')[:3].upper()
 
         filtered_list.append(item)
 
-    f.close()
+    return filtered_list
 
 
-def get_talkgroup_channels(repeater_id):
+def get_talkgroup_channels(repeater_id, http_session=session, log=print):
     """
     Get talkgroups for a specific repeater from BrandMeister API
     
     Args:
         repeater_id (int): Repeater ID
+        http_session (requests.Session): Session used for the request
+        log (callable): print-like function receiving console output
         
     Returns:
         list: List of talkgroup IDs configured for this repeater
     """
     try:
         url = f'https://api.brandmeister.network/v2/device/{repeater_id}/talkgroup'
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        response = requests.get(url, verify=False)
+        response = http_session.get(url, verify=False)
         response.raise_for_status()
         talkgroups_data = response.json()
         
@@ -184,126 +263,154 @@ def get_talkgroup_channels(repeater_id):
         
         return tg_ids
     except Exception as e:
-        print(f"Error fetching talkgroups for repeater {repeater_id}: {e}")
+        log(f"Error fetching talkgroups for repeater {repeater_id}: {e}")
         return []
 
 
-def format_talkgroup_channel(item, tg_id, timeslot):
-    """Add talkgroup channel to output list"""
-    global output_list
+def get_talkgroup_name(tg_id, http_session=session):
+    """
+    Get the name of a talkgroup from BrandMeister API
+    
+    Args:
+        tg_id (str): Talkgroup ID
+        http_session (requests.Session): Session used for the request
+        
+    Returns:
+        tuple: Talkgroup name (empty if it has none) and the error raised by the request, if any
+    """
+    try:
+        url = f'https://api.brandmeister.network/v2/talkgroup/{tg_id}'
+        response = http_session.get(url, verify=False)
+        response.raise_for_status()
+        data = response.json()
+        return (data.get('Name') or '').rstrip(), None
+    except Exception as e:
+        return None, e
+
+
+def load_talkgroup_names():
+    """Load talkgroup names cached by previous runs as [name, fetch time] entries, leaving out expired ones"""
+    try:
+        with open(tg_name_cache_file, 'rb') as file:
+            tg_names = json.loads(file.read())
+    except (OSError, ValueError):
+        return {}
     
+    # Entries in any other shape come from an older cache format or a damaged file and are fetched again
+    if not isinstance(tg_names, dict):
+        return {}
+    oldest = time.time() - tg_name_cache_max_age
+    return {tg_id: entry for tg_id, entry in tg_names.items()
+            if isinstance(entry, list) and len(entry) == 2 and isinstance(entry[0], str)
+            and isinstance(entry[1], (int, float)) and not isinstance(entry[1], bool) and entry[1] >= oldest}
+
+
+def save_talkgroup_names(tg_names, log=print):
+    """Save talkgroup names for later runs, replacing the cache file atomically"""
+    try:
+        fd, temp_file = tempfile.mkstemp(prefix=f'{tg_name_cache_file}.', suffix='.tmp',
+                                         dir=os.path.dirname(tg_name_cache_file) or '.')
+        with os.fdopen(fd, 'w') as file:
+            json.dump(tg_names, file)
+        os.replace(temp_file, tg_name_cache_file)
+    except OSError as e:
+        log(f"Error saving talkgroup name cache: {e}")
+
+
+def format_talkgroup_channel(output_list, item, tg_id, timeslot):
+    """Add talkgroup channel to output list"""
     # Add to output list for display (swap rx/tx for radio perspective)
     output_list.append([item['callsign'], item['tx'], item['rx'], item['colorcode'], item['city'], item['last_seen'],
                         f"https://brandmeister.network/?page=repeater&id={item['id']} TG{tg_id}"])
 
 
-def format_channel(item):
-    global output_list
+def channel_base_name(item):
+    """Channel name without the timeslot suffix, truncating the callsign so the full name fits in 16 characters"""
+    city_abbr = item['_city_abbr']
+    # Both suffixes (" TS1", " TS2") are 4 characters long
+    max_callsign_len = 16 - len(ts_suffixes[0]) - 1 - len(city_abbr)
+    return f"{item['callsign'][:max_callsign_len]}.{city_abbr}"
 
-    # Create city abbreviation
-    city = item['city'].split(',')[0].strip() if item['city'] else 'Unknown'
-    city_abbr = city[:3].upper() if len(city) >= 3 else (city + 'XXX')[:3].upper()
+
+def format_channel(output_list, item):
+    base_name = channel_base_name(item)
+    url = f"https://brandmeister.network/?page=repeater&id={item['id']}"
     
     # Create channels for both timeslots
-    for slot in [1, 2]:
-        # Ensure channel name fits in 16 characters with TS suffix
-        base_name = f"{item['callsign']}.{city_abbr}"
-        ts_suffix = f" TS{slot}"
-        if len(base_name + ts_suffix) > 16:
-            # Truncate callsign to fit
-            max_callsign_len = 16 - len(f".{city_abbr}{ts_suffix}")
-            truncated_callsign = item['callsign'][:max_callsign_len]
-            ch_alias = f"{truncated_callsign}.{city_abbr}{ts_suffix}"
-        else:
-            ch_alias = base_name + ts_suffix
-        
-        output_list.append([ch_alias, item['tx'], item['rx'], item['colorcode'], item['city'], item['last_seen'],
-                            f"https://brandmeister.network/?page=repeater&id={item['id']}"])
+    for ts_suffix in ts_suffixes:
+        output_list.append([base_name + ts_suffix, item['tx'], item['rx'], item['colorcode'], item['city'],
+                            item['last_seen'], url])
 
 
-def cleanup_contact_uploads():
+def cleanup_contact_uploads(log=print):
     """Delete files in the contact_uploads directory after processing"""
-    import os
-    
-    # Clean up regular contact_uploads directory
-    if exists('contact_uploads'):
-        for file in os.listdir('contact_uploads'):
-            file_path = os.path.join('contact_uploads', file)
-            try:
-                if os.path.isfile(file_path):
-                    os.unlink(file_path)
-                    print(f"Deleted {file_path}")
-            except Exception as e:
-                print(f"Error deleting {file_path}: {e}")
-    
-    # Clean up user-specific contact_uploads directories
-    for dir_name in os.listdir('.'):
-        if dir_name.startswith('contact_uploads_'):
-            for file in os.listdir(dir_name):
-                file_path = os.path.join(dir_name, file)
+    # Regular contact_uploads directory plus user-specific contact_uploads_* directories
+    upload_dirs = ['contact_uploads'] if exists('contact_uploads') else []
+    with os.scandir('.') as top:
+        upload_dirs += [entry.name for entry in top
+                        if entry.name.startswith('contact_uploads_') and entry.is_dir()]
+
+    for dir_name in upload_dirs:
+        with os.scandir(dir_name) as entries:
+            for entry in entries:
                 try:
-                    if os.path.isfile(file_path):
-                        os.unlink(file_path)
-                        print(f"Deleted {file_path}")
+                    if entry.is_file():
+                        os.unlink(entry.path)
+                        log(f"Deleted {entry.path}")
                 except Exception as e:
-                    print(f"Error deleting {file_path}: {e}")
+                    log(f"Error deleting {entry.path}: {e}")
 
 
-def process_channels():
-    global output_list
+def process_channels(args, filtered_list, output_files, log=print):
+    """
+    Create channels for the selected repeaters, and talkgroups.csv in talkgroup mode
+    
+    Args:
+        args (argparse.Namespace): Parsed arguments with the zone options
+        filtered_list (list): Repeaters returned by fetch_repeaters()
+        output_files (dict): Generated file contents, talkgroups.csv is added here
+        log (callable): print-like function receiving console output
+        
+    Returns:
+        tuple: Channel list for channels.csv and talkgroups of each repeater keyed by repeater ID
+    """
+    output_list = []
+    tg_channels_by_id = {}
 
     if args.talkgroups:
+        # Fetch talkgroups of all repeaters concurrently, each call is a network round trip
+        repeater_ids = [item['id'] for item in filtered_list]
+        with ThreadPoolExecutor(max_workers=talkgroup_workers) as executor:
+            tg_channels_by_id = dict(zip(repeater_ids, executor.map(partial(get_talkgroup_channels, log=log), repeater_ids)))
+        
         # Collect all unique talkgroup IDs first
         unique_talkgroups = set()
         
         # First pass: collect all talkgroup IDs
         for item in filtered_list:
             try:
-                tg_channels = get_talkgroup_channels(item['id'])
+                tg_channels = tg_channels_by_id[item['id']]
                 for tg_id, slot in tg_channels:
                     unique_talkgroups.add(tg_id)
             except Exception as e:
-                print(f"Error collecting talkgroups for {item['callsign']}: {e}")
+                log(f"Error collecting talkgroups for {item['callsign']}: {e}")
         
         # Process talkgroups.csv first to ensure it exists with all needed talkgroups
         try:
-            import csv
-            import time
-            import os
-            import shutil
-            
-            # Create output directory if it doesn't exist
-            if not os.path.exists(args.output):
-                os.makedirs(args.output)
-            
-            talkgroups_file = os.path.join(args.output, 'talkgroups.csv')
+            template_file = 'talkgroups_template.csv'
             
             # Check for custom template in user-specific talkgroups_uploads directory first
-            user_uploads_dir = None
-            for dir_name in os.listdir('.'):
-                if dir_name.startswith('talkgroups_uploads_'):
-                    user_uploads_dir = dir_name
-                    break
-                    
-            if user_uploads_dir:
-                custom_template = os.path.join(user_uploads_dir, 'talkgroups_template.csv')
-                if exists(custom_template):
-                    try:
-                        shutil.copy(custom_template, talkgroups_file)
-                        print(f"Copied custom talkgroups_template.csv from {user_uploads_dir} to {talkgroups_file}")
-                    except Exception as e:
-                        print(f"Error copying custom talkgroups template from {user_uploads_dir}: {e}")
+            custom_templates = glob('talkgroups_uploads_*/talkgroups_template.csv')
+            if custom_templates:
+                template_file = custom_templates[0]
+                log(f"Using custom talkgroups_template.csv from {os.path.dirname(template_file)}")
             
             # Fall back to default template if no custom template exists
-            if not exists(talkgroups_file) and exists('talkgroups_template.csv'):
-                try:
-                    shutil.copy('talkgroups_template.csv', talkgroups_file)
-                    print(f"Copied default talkgroups_template.csv to {talkgroups_file}")
-                except Exception as e:
-                    print(f"Error copying default talkgroups template: {e}")
+            if template_file == 'talkgroups_template.csv':
+                log("Using default talkgroups_template.csv")
             
-            # Read the existing CSV file
-            with open(talkgroups_file, 'r', newline='') as csvfile:
+            # Read the template CSV file
+            with open(template_file, 'r', newline='') as csvfile:
                 reader = csv.reader(csvfile)
                 rows = list(reader)
             
@@ -317,65 +424,81 @@ def process_channels():
                 if len(row) > 1 and row[1]:  # Check if column B (Radio ID) has a value
                     existing_tg_ids.add(row[1])
             
-            # Create new rows with talkgroup data
-            new_rows = []
+            # Collect talkgroups missing from the template, these need a name
+            new_tg_ids = []
             for tg_id in sorted(unique_talkgroups):
                 # Extract only numeric characters from talkgroup ID
-                numeric_tg_id = ''.join(c for c in str(tg_id) if c.isdigit())
+                numeric_tg_id = str(tg_id)
+                if not numeric_tg_id.isdigit():
+                    numeric_tg_id = ''.join(filter(str.isdigit, numeric_tg_id))
                 if numeric_tg_id and numeric_tg_id not in existing_tg_ids:  # Only add if not already in contacts
-                    # Fetch talkgroup name from BrandMeister API
-                    tg_name = None
-                    try:
-                        print(f"Fetching name for TG {numeric_tg_id}...", end="", flush=True)
-                        url = f'https://api.brandmeister.network/v2/talkgroup/{numeric_tg_id}'
-                        response = requests.get(url, verify=False)
-                        response.raise_for_status()
-                        data = response.json()
-                        if 'Name' in data and data['Name']:
-                            tg_name = data['Name'].rstrip()
-                            print(f" Found: {data['Name']}")
-                        else:
-                            tg_name = numeric_tg_id  # Fallback to ID if no name
-                            print(" No name found")
-                        time.sleep(0.2)  # Be nice to the API
-                    except Exception as api_error:
-                        print(f"\nError fetching name for TG {numeric_tg_id}: {api_error}")
-                        tg_name = numeric_tg_id  # Fallback to ID if API fails
-                    
-                    # Create new row in talkgroups.csv format: [No., Radio ID, Name, Call Type, Call Alert]
-                    new_row = [len(rows) + len(new_rows), numeric_tg_id, tg_name, 'Group Call', 'None']
-                    new_rows.append(new_row)
+                    new_tg_ids.append(numeric_tg_id)
+            
+            # Fetch names not cached by a previous run concurrently, the pool size also limits the API load
+            # A forced download refreshes the cached names of these talkgroups as well
+            tg_names = load_talkgroup_names()
+            uncached_tg_ids = [tg_id for tg_id in dict.fromkeys(new_tg_ids) if args.force or tg_id not in tg_names]
+            fetched_at = time.time()
+            with ThreadPoolExecutor(max_workers=talkgroup_name_workers) as executor:
+                fetched_names = dict(zip(uncached_tg_ids, executor.map(get_talkgroup_name, uncached_tg_ids)))
+            
+            # Create new rows with talkgroup data
+            new_rows = []
+            for numeric_tg_id in new_tg_ids:
+                if numeric_tg_id not in fetched_names:
+                    tg_name = tg_names[numeric_tg_id][0]
+                    log(f"Name for TG {numeric_tg_id} (cached): {tg_name}")
+                else:
+                    tg_name, api_error = fetched_names[numeric_tg_id]
+                    if api_error:
+                        log(f"Error fetching name for TG {numeric_tg_id}: {api_error}")
+                        # Fallback to the cached name or the ID if API fails
+                        tg_name = tg_names[numeric_tg_id][0] if numeric_tg_id in tg_names else numeric_tg_id
+                    elif tg_name:
+                        log(f"Fetching name for TG {numeric_tg_id}... Found: {tg_name}")
+                        tg_names[numeric_tg_id] = [tg_name, fetched_at]
+                    else:
+                        log(f"Fetching name for TG {numeric_tg_id}... No name found")
+                        tg_names.pop(numeric_tg_id, None)
+                        tg_name = numeric_tg_id  # Fallback to ID if no name
+                
+                # Create new row in talkgroups.csv format: [No., Radio ID, Name, Call Type, Call Alert]
+                new_row = [len(rows) + len(new_rows), numeric_tg_id, tg_name, 'Group Call', 'None']
+                new_rows.append(new_row)
             
-            # Write the updated CSV file with existing entries plus new ones
-            with open(talkgroups_file, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile, lineterminator='\r\n')
-                # For talkgroups template format, write header and all rows
-                if len(header_rows) == 1:  # Simple talkgroups format
-                    writer.writerows(header_rows)
-                    writer.writerows(rows[1:])  # Write existing template entries
-                    writer.writerows(new_rows)  # Append new unique entries
-                else:  # Complex contact format
-                    writer.writerows(header_rows)
-                    writer.writerows(rows[2:])  # Write existing entries after headers
-                    writer.writerows(new_rows)  # Append new unique entries
+            if uncached_tg_ids:
+                save_talkgroup_names(tg_names, log)
             
-            print(f"Updated {talkgroups_file} with {len(new_rows)} new unique talkgroups (total: {len(rows[2:]) + len(new_rows)})")
+            # Build the CSV file with existing entries plus new ones
+            csvfile = io.StringIO()
+            writer = csv.writer(csvfile, lineterminator='\r\n')
+            # For talkgroups template format, write header and all rows
+            if len(header_rows) == 1:  # Simple talkgroups format
+                writer.writerows(header_rows)
+                writer.writerows(rows[1:])  # Write existing template entries
+                writer.writerows(new_rows)  # Append new unique entries
+            else:  # Complex contact format
+                writer.writerows(header_rows)
+                writer.writerows(rows[2:])  # Write existing entries after headers
+                writer.writerows(new_rows)  # Append new unique entries
+            output_files['talkgroups.csv'] = csvfile.getvalue().encode()
+            
+            log(f"Generated talkgroups.csv with {len(new_rows)} new unique talkgroups (total: {len(rows[2:]) + len(new_rows)})")
         except Exception as e:
-            print(f"Error updating talkgroups.csv: {e}")
+            log(f"Error updating talkgroups.csv: {e}")
         
         # Now create channels using the updated talkgroups.csv
-        output_list = []  # Global output list for all channels
         for item in filtered_list:
             try:
-                tg_channels = get_talkgroup_channels(item['id'])
+                tg_channels = tg_channels_by_id[item['id']]
                 if not tg_channels:
                     continue  # Skip repeaters with no talkgroups
                     
                 for tg_id, slot in tg_channels:
-                    format_talkgroup_channel(item, tg_id, slot)
+                    format_talkgroup_channel(output_list, item, tg_id, slot)
                 
                 # Use city name for zone name
-                city = item['city'].split(',')[0].strip()
+                city = item['_city_base']
                 callsign = item['callsign']
                 
                 # Create filename (can be longer)
@@ -394,14 +517,14 @@ def process_channels():
                 zone_alias = zone_alias[:16]
                 
             except Exception as e:
-                print(f"Error processing talkgroups for {item['callsign']}: {e}")
+                log(f"Error processing talkgroups for {item['callsign']}: {e}")
         
         # Show complete list of all channels after processing all repeaters
-        if output_list:
-            print('\n',
-                  tabulate(output_list, headers=['Callsign', 'RX', 'TX', 'CC', 'City', 'Last seen', 'URL'],
-                           disable_numparse=True),
-                  '\n')
+        if output_list and not args.quiet:
+            log('\n',
+                tabulate(output_list, headers=['Callsign', 'RX', 'TX', 'CC', 'City', 'Last seen', 'URL'],
+                         disable_numparse=True),
+                '\n')
         
 
     else:
@@ -414,26 +537,35 @@ def process_channels():
             output_list = []
 
             for item in chunk:
-                format_channel(item)
+                format_channel(output_list, item)
 
-            print('\n',
-                  tabulate(output_list, headers=['Callsign', 'RX', 'TX', 'CC', 'City', 'Last seen', 'URL'],
-                           disable_numparse=True),
-                  '\n')
+            if not args.quiet:
+                log('\n',
+                    tabulate(output_list, headers=['Callsign', 'RX', 'TX', 'CC', 'City', 'Last seen', 'URL'],
+                             disable_numparse=True),
+                    '\n')
 
             if len(channel_chunks) == 1:
                 zone_alias = args.name
             else:
                 zone_alias = f'{args.name} #{chunk_number}'
 
-def write_channels_csv():
+    return output_list, tg_channels_by_id
+
+
+def csv_field(value):
+    """Quote a CSV field the same way csv.writer does with its default minimal quoting"""
+    if value is None:
+        return ''
+    value = str(value)
+    if ',' in value or '"' in value or '\r' in value or '\n' in value:
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def write_channels_csv(args, output_list, filtered_list, tg_channels_by_id, output_files, log=print):
     """Write channels data to channels.csv"""
-    import csv
-    import os
-    
-    channels_file = os.path.join(args.output, 'channels.csv')
-    
-    with open(channels_file, 'w', newline='') as csvfile:
+    with io.StringIO() as csvfile:
         writer = csv.writer(csvfile, lineterminator='\r\n')
         # Write header based on updated channels.csv structure
         writer.writerow(['No.', 'Channel Name', 'Receive Frequency', 'Transmit Frequency', 'Channel Type', 
@@ -448,6 +580,39 @@ def write_channels_csv():
                         'DataACK Disable', 'R5toneBot', 'R5ToneEot', 'Auto Scan', 'Ana Aprs Mute', 'Send Talker Alias', 
                         'AnaAprsTxPath', 'ARC4', 'ex_emg_kind', 'TxCC'])
         
+        # Every channel row has the same fixed settings, only the {} fields change per channel
+        row_template = ','.join(['{}', '{}', '{}', '{}', 'D-Digital', 'Turbo', '12.5K', 'Off', 'Off',
+                                 '{}', 'Group Call', '{}', '', 'Always', 'Carrier', 'Off', '1', '1', '1', 'Off',
+                                 '{}', '{}', 'None', 'None', 'Off', 'Off', 'Off', 'Off', 'Normal Encryption',
+                                 'Off', 'Off', 'Off', 'Off', '0', '1', 'Off', 'Off', 'Off', 'Off', 'Off', 'Off', '1',
+                                 '1', 'Off', '0', '1', '0', '0', '0', '0', '0', '0', '0', '0', '0', '{}']) + '\r\n'
+        
+        # Index repeaters by their (tx, rx) pair, which is the (rx, tx) pair of the channel
+        repeaters_by_freq = {}
+        for item in filtered_list:
+            repeaters_by_freq.setdefault((item['tx'], item['rx']), item)
+        
+        # Load talkgroup names from talkgroups.csv once, keeping the first named row per ID
+        tg_name_by_id = {}
+        if args.talkgroups and 'talkgroups.csv' in output_files:
+            try:
+                reader = csv.reader(io.StringIO(output_files['talkgroups.csv'].decode(), newline=''))
+                next(reader)  # Skip header row
+                for row in reader:
+                    if len(row) > 2 and row[2]:  # Column B=Radio ID, Column C=Name
+                        tg_name_by_id.setdefault(row[1], row[2])
+            except Exception:
+                pass
+        
+        # Fetch names missing from talkgroups.csv from BrandMeister API, once per talkgroup and concurrently
+        if args.talkgroups:
+            missing_tg_ids = sorted({channel[6].split('TG')[1].strip() for channel in output_list
+                                     if len(channel) > 6 and 'TG' in channel[6]} - tg_name_by_id.keys())
+            with ThreadPoolExecutor(max_workers=talkgroup_name_workers) as executor:
+                for tg_id, (tg_name, api_error) in zip(missing_tg_ids, executor.map(get_talkgroup_name, missing_tg_ids)):
+                    if tg_name:
+                        tg_name_by_id[tg_id] = tg_name
+        
         # Write channel data from output_list
         for i, channel in enumerate(output_list, 1):
             # Extract data from output_list format: [callsign, rx, tx, cc, city, last_seen, url]
@@ -464,42 +629,19 @@ def write_channels_csv():
                 url_parts = channel[6].split('TG')
                 if len(url_parts) > 1:
                     tg_id = url_parts[1].strip()
-                    # Get contact name from talkgroups.csv first
-                    try:
-                        talkgroups_file = os.path.join(args.output, 'talkgroups.csv')
-                        if os.path.exists(talkgroups_file):
-                            with open(talkgroups_file, 'r', newline='') as cf:
-                                reader = csv.reader(cf)
-                                next(reader)  # Skip header row
-                                for row in reader:
-                                    if len(row) > 2 and row[1] == tg_id and row[2]:  # Column B=Radio ID, Column C=Name
-                                        contact_name = row[2][:16].rstrip()
-                                        break
-                    except Exception:
-                        pass
-                    
-                    # If not found in talkgroups.csv, try BrandMeister API
-                    if contact_name == 'Simplex':
-                        try:
-                            url = f'https://api.brandmeister.network/v2/talkgroup/{tg_id}'
-                            response = requests.get(url, verify=False)
-                            response.raise_for_status()
-                            data = response.json()
-                            if 'Name' in data and data['Name']:
-                                contact_name = data['Name'][:16].rstrip()
-                        except Exception:
-                            pass
+                    # Get contact name from talkgroups.csv or BrandMeister API
+                    if tg_id in tg_name_by_id:
+                        contact_name = tg_name_by_id[tg_id][:16].rstrip()
                     
                     # Set channel name based on contact name
                     if contact_name != 'Simplex':
                         if args.city_prefix:
-                            # Get city from filtered_list
-                            for item in filtered_list:
-                                if item['tx'] == rx_freq and item['rx'] == tx_freq:
-                                    city = item['city'].split(',')[0].strip()
-                                    city_abbr = city[:3].upper() if len(city) >= 3 else (city + 'XXX')[:3].upper()
-                                    channel_name = f"{city_abbr}.{contact_name}"[:16].rstrip()
-                                    break
+                            # Get city of the repeater on these frequencies
+                            item = repeaters_by_freq.get((rx_freq, tx_freq))
+                            if item:
+                                # Repeaters without a city keep the XXX prefix
+                                city_abbr = item['_city_abbr'] if item['city'] else 'XXX'
+                                channel_name = f"{city_abbr}.{contact_name}"[:16].rstrip()
                         else:
                             channel_name = contact_name.rstrip()
                     
@@ -507,13 +649,12 @@ def write_channels_csv():
                     if contact_name == 'Simplex':
                         tg_name = tg_id  # Use just the number to match talkgroups.csv
                         if args.city_prefix:
-                            # Get city from filtered_list
-                            for item in filtered_list:
-                                if item['tx'] == rx_freq and item['rx'] == tx_freq:
-                                    city = item['city'].split(',')[0].strip()
-                                    city_abbr = city[:3].upper() if len(city) >= 3 else (city + 'XXX')[:3].upper()
-                                    channel_name = f"{city_abbr}.{tg_name}"[:16].rstrip()
-                                    break
+                            # Get city of the repeater on these frequencies
+                            item = repeaters_by_freq.get((rx_freq, tx_freq))
+                            if item:
+                                # Repeaters without a city keep the XXX prefix
+                                city_abbr = item['_city_abbr'] if item['city'] else 'XXX'
+                                channel_name = f"{city_abbr}.{tg_name}"[:16].rstrip()
                         else:
                             channel_name = tg_name.rstrip()
                         contact_name = tg_name
@@ -522,17 +663,12 @@ def write_channels_csv():
             if args.talkgroups and len(channel) > 6 and 'TG' in channel[6]:
                 # Get slot from repeater talkgroup data
                 slot = '1'  # Default
-                for item in filtered_list:
-                    if item['tx'] == rx_freq and item['rx'] == tx_freq:
-                        try:
-                            tg_channels = get_talkgroup_channels(item['id'])
-                            for tg_id_api, slot_api in tg_channels:
-                                if str(tg_id_api) == tg_id:
-                                    slot = str(slot_api)
-                                    break
-                        except Exception:
-                            pass
-                        break
+                item = repeaters_by_freq.get((rx_freq, tx_freq))
+                if item:
+                    for tg_id_api, slot_api in tg_channels_by_id.get(item['id'], []):
+                        if str(tg_id_api) == tg_id:
+                            slot = str(slot_api)
+                            break
             else:
                 # Standard mode: extract slot from channel name
                 if 'TS1' in channel_name:
@@ -543,23 +679,18 @@ def write_channels_csv():
                     slot = '1'
             
             # Write row with proper contact data and scan list set to None
-            writer.writerow([i, channel_name, rx_freq, tx_freq, 'D-Digital', 'Turbo', '12.5K', 'Off', 'Off', 
-                           contact_name, 'Group Call', tg_id, '', 'Always', 'Carrier', 'Off', '1', '1', '1', 'Off', 
-                           color_code, slot, 'None', 'None', 'Off', 'Off', 'Off', 'Off', 'Normal Encryption', 
-                           'Off', 'Off', 'Off', 'Off', '0', '1', 'Off', 'Off', 'Off', 'Off', 'Off', 'Off', '1', 
-                           '1', 'Off', '0', '1', '0', '0', '0', '0', '0', '0', '0', '0', '0', color_code])
+            csvfile.write(row_template.format(i, csv_field(channel_name), csv_field(rx_freq), csv_field(tx_freq),
+                                              csv_field(contact_name), csv_field(tg_id), csv_field(color_code),
+                                              slot, csv_field(color_code)))
+        
+        output_files['channels.csv'] = csvfile.getvalue().encode()
     
-    print(f'Channels CSV file "{channels_file}" written.')
+    log('Channels CSV file "channels.csv" generated.')
 
 
-def write_zones_csv():
+def write_zones_csv(args, filtered_list, tg_channels_by_id, output_files, log=print):
     """Write zones data to zones.csv"""
-    import csv
-    import os
-    
-    zones_file = os.path.join(args.output, 'zones.csv')
-    
-    with open(zones_file, 'w', newline='') as csvfile:
+    with io.StringIO() as csvfile:
         writer = csv.writer(csvfile, lineterminator='\r\n')
         # Write header based on updated zones.csv structure
         writer.writerow(['No.', 'Zone Name', 'Zone Channel Member', 'Zone Channel Member RX Frequency', 
@@ -570,13 +701,17 @@ def write_zones_csv():
         if args.talkgroups:
             # For talkgroup mode, create one zone per repeater
             zone_num = 1
+            
+            # Get channel rows from the generated channels.csv
+            channel_rows = list(csv.reader(io.StringIO(output_files['channels.csv'].decode(), newline='')))[1:]
+            
             for item in filtered_list:
                 try:
-                    tg_channels = get_talkgroup_channels(item['id'])
+                    tg_channels = tg_channels_by_id.get(item['id'], [])
                     if not tg_channels:
                         continue
                     
-                    city = item['city'].split(',')[0].strip() if item['city'] else 'Unknown'
+                    city = item['_city_base']
                     callsign = item['callsign']
                     zone_name = f"{callsign}_{city.replace(' ', '_')}"
                     
@@ -586,16 +721,11 @@ def write_zones_csv():
                     tx_freqs = []
                     
                     # Get channel names from channels.csv for this repeater
-                    channels_file = os.path.join(args.output, 'channels.csv')
-                    if os.path.exists(channels_file):
-                        with open(channels_file, 'r', newline='') as cf:
-                            reader = csv.reader(cf)
-                            next(reader)  # Skip header
-                            for row in reader:
-                                if len(row) > 3 and row[2] == str(item['tx']) and row[3] == str(item['rx']):
-                                    channel_names.append(row[1])  # Channel Name
-                                    rx_freqs.append(item['tx'])
-                                    tx_freqs.append(item['rx'])
+                    for row in channel_rows:
+                        if len(row) > 3 and row[2] == str(item['tx']) and row[3] == str(item['rx']):
+                            channel_names.append(row[1])  # Channel Name
+                            rx_freqs.append(item['tx'])
+                            tx_freqs.append(item['rx'])
                     
                     # Write zone row with Zone Hide column
                     writer.writerow([zone_num, zone_name[:16], '|'.join(channel_names), '|'.join(rx_freqs), 
@@ -605,7 +735,7 @@ def write_zones_csv():
                                    rx_freqs[0] if rx_freqs else '', tx_freqs[0] if tx_freqs else '', '0'])
                     zone_num += 1
                 except Exception as e:
-                    print(f"Error processing zone for {item['callsign']}: {e}")
+                    log(f"Error processing zone for {item['callsign']}: {e}")
         else:
             # For standard mode, create zones based on capacity
             channel_chunks = [filtered_list[i:i + args.zone_capacity] for i in range(0, len(filtered_list), args.zone_capacity)]
@@ -622,22 +752,11 @@ def write_zones_csv():
                 tx_freqs = []
                 
                 for item in chunk:
-                    # Create city abbreviation
-                    city = item['city'].split(',')[0].strip() if item['city'] else 'Unknown'
-                    city_abbr = city[:3].upper() if len(city) >= 3 else (city + 'XXX')[:3].upper()
+                    base_name = channel_base_name(item)
                     
                     # Create channels for both timeslots with same logic as channels.csv
-                    for slot in [1, 2]:
-                        base_name = f"{item['callsign']}.{city_abbr}"
-                        ts_suffix = f" TS{slot}"
-                        if len(base_name + ts_suffix) > 16:
-                            max_callsign_len = 16 - len(f".{city_abbr}{ts_suffix}")
-                            truncated_callsign = item['callsign'][:max_callsign_len]
-                            ch_alias = f"{truncated_callsign}.{city_abbr}{ts_suffix}"
-                        else:
-                            ch_alias = base_name + ts_suffix
-                        
-                        channel_names.append(ch_alias)
+                    for ts_suffix in ts_suffixes:
+                        channel_names.append(base_name + ts_suffix)
                         rx_freqs.append(item['tx'])
                         tx_freqs.append(item['rx'])
                 
@@ -647,31 +766,107 @@ def write_zones_csv():
                                rx_freqs[0] if rx_freqs else '', tx_freqs[0] if tx_freqs else '',
                                channel_names[0] if channel_names else '', 
                                rx_freqs[0] if rx_freqs else '', tx_freqs[0] if tx_freqs else '', '0'])
+        
+        output_files['zones.csv'] = csvfile.getvalue().encode()
     
-    print(f'Zones CSV file "{zones_file}" written.')
+    log('Zones CSV file "zones.csv" generated.')
 
 
-def write_talkgroups_csv():
+def write_talkgroups_csv(output_files, log=print):
     """Write talkgroups data to talkgroups.csv (already in correct format)"""
-    import os
+    if 'talkgroups.csv' in output_files:
+        log('Talkgroups CSV file "talkgroups.csv" generated with user template data.')
+    else:
+        log('No talkgroups.csv found')
+
+
+def save_output_file(name, data, output_dir='output', log=print):
+    """Save a generated file into the output directory"""
+    # Create output directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
     
-    talkgroups_file = os.path.join(args.output, 'talkgroups.csv')
+    file_path = os.path.join(output_dir, name)
+    with open(file_path, 'wb') as file:
+        file.write(data)
     
-    if os.path.exists(talkgroups_file):
-        print(f'Talkgroups CSV file "{talkgroups_file}" already exists with user template data.')
-    else:
-        print('No talkgroups.csv found')
+    log(f'Saved to {file_path}')
 
 
-if __name__ == '__main__':
-    download_file()
-    filter_list()
-    process_channels()
+def parse_args(argv=None):
+    """Parse command line arguments (defaults to sys.argv)"""
+    return parser.parse_args(argv)
+
+
+def fetch_repeaters(args, download=True, log=print):
+    """
+    Download the BrandMeister repeater list if needed and filter it
+    
+    Args:
+        args (argparse.Namespace): Parsed arguments with the band and search options
+        download (bool): Download the repeater list first, False if the caller already did
+        log (callable): print-like function receiving console output
+        
+    Returns:
+        list: Repeaters matching the search options
+    """
+    qth_coords = None
+
+    if args.type == 'qth':
+        qth_coords = maidenhead.to_location(args.qth, center=True)
+    if args.type == 'gps':
+        qth_coords = (args.lat, args.lon)
+
+    if args.mcc and not str(args.mcc).isdigit():
+        args.mcc = mobile_codes.alpha2(args.mcc)[4]
+
+    if download:
+        download_file(args.force, log)
+
+    return filter_list(args, qth_coords)
+
+
+def build_zone(args, repeaters, write_to=None, log=print):
+    """
+    Create channels for the given repeaters and generate all CSV files in memory
+    
+    Args:
+        args (argparse.Namespace): Parsed arguments with the zone and output options
+        repeaters (list): Repeaters returned by fetch_repeaters()
+        write_to (callable): Optional function called with (file name, bytes) for every generated file
+        log (callable): print-like function receiving console output
+        
+    Returns:
+        dict: Generated file contents as bytes keyed by file name
+    """
+    output_files = {}
+
+    output_list, tg_channels_by_id = process_channels(args, repeaters, output_files, log)
     
     # Write CSV files
-    write_channels_csv()
+    write_channels_csv(args, output_list, repeaters, tg_channels_by_id, output_files, log)
     if args.talkgroups:
-        write_talkgroups_csv()
-    write_zones_csv()
+        write_talkgroups_csv(output_files, log)
+    write_zones_csv(args, repeaters, tg_channels_by_id, output_files, log)
+    
+    if write_to:
+        for name, data in output_files.items():
+            write_to(name, data)
     
-    cleanup_contact_uploads()
\ No newline at end of file
+    cleanup_contact_uploads(log)
+
+    return output_files
+
+
+def main(argv=None):
+    """Parse command line arguments and generate all CSV files"""
+    args = parse_args(argv)
+
+    # Validate that name is provided if not using talkgroups mode
+    if not args.name and not args.talkgroups:
+        parser.error("the -n/--name argument is required when not using -tg/--talkgroups")
+
+    build_zone(args, fetch_repeaters(args), write_to=partial(save_output_file, output_dir=args.output))
+
+
+if __name__ == '__main__':
+    main()